@@ -1,8 +1,17 @@
 import asyncio
+import copy
+import hashlib
 import json
+import time
+from collections import Counter, OrderedDict, deque
+from contextlib import AsyncExitStack, nullcontext
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional
 
+import httpx
+import orjson
+import tiktoken
 from fastmcp import Client
 from fastmcp.client.transports import StdioTransport, StreamableHttpTransport
 from loguru import logger
@@ -16,9 +25,34 @@ class AgentSettings(BaseModel):
     model_name: str = "deepseek/deepseek-chat-v3.1:free"
     max_tool_call_iterations: int = 5
     max_context_tokens: int = 4000
+    max_parallel_tool_calls: int = 8
+    max_parallel_tool_calls_per_server: int = 4
+    max_parallel_messages: int = 8
+    # Number of responses kept for exact repeats of a request; 0 disables caching
+    response_cache_size: int = 0
+
+
+@lru_cache(maxsize=4)
+def _get_encoder(model_name: str) -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        # Non-OpenAI model names (e.g. OpenRouter ids) have no registered encoding
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _tool_message(tool_call_id: str, function_name: str, content: str) -> dict:
+    return {
+        "role": "tool",
+        "tool_call_id": tool_call_id,
+        "name": function_name,
+        "content": content,
+    }
 
 
 class GetDatetimeTool:
+    __slots__ = ()
+
     name = "get_datetime"
     metadata = {
         "type": "function",
@@ -27,13 +61,23 @@ class GetDatetimeTool:
             "description": "Get the current date and time in ISO 8601 format",
         },
     }
+    # Formatted timestamp reused for calls within a second of each other. The
+    # bucket is measured on the monotonic clock so wall-clock steps can't pin it.
+    _last_ts_ns: Optional[int] = None
+    _last_ts_str = ""
 
     @classmethod
     async def call(cls, agent: "Agent") -> str:
-        return datetime.now().isoformat()
+        now_ns = time.monotonic_ns()
+        if cls._last_ts_ns is None or now_ns - cls._last_ts_ns >= 1_000_000_000:
+            cls._last_ts_ns = now_ns
+            cls._last_ts_str = datetime.now().isoformat()
+        return cls._last_ts_str
 
 
 class GetTotalContextTokensTool:
+    __slots__ = ()
+
     name = "get_total_context_tokens"
     metadata = {
         "type": "function",
@@ -49,6 +93,8 @@ class GetTotalContextTokensTool:
 
 
 class ClearContextTool:
+    __slots__ = ()
+
     name = "clear_context"
     metadata = {
         "type": "function",
@@ -64,7 +110,17 @@ class ClearContextTool:
         return "Context cleared."
 
 
+# Chat commands answered by a built-in tool directly, without calling the model
+LOCAL_COMMANDS = {
+    "/now": GetDatetimeTool,
+    "/tokens": GetTotalContextTokensTool,
+    "/clear": ClearContextTool,
+}
+
+
 class MCPTool:
+    __slots__ = ("client", "name", "is_persistent", "metadata")
+
     def __init__(self, client: Client, tool_info, keep_alive: bool = False):
         self.client = client
         self.name = tool_info.name
@@ -79,7 +135,15 @@ class MCPTool:
         }
 
     async def call(self, agent: "Agent", **kwargs):
-        if self.is_persistent:
+        # Promotion is agent state, so it ends when the agent closes its sessions
+        persistent = self.is_persistent or self.client in agent._promoted_clients
+        if not persistent:
+            agent._client_call_counts[self.client] += 1
+            if agent._client_call_counts[self.client] > 1:
+                # Repeated use: keep the session open instead of reconnecting
+                await agent._keep_mcp_client_alive(self.client)
+                persistent = True
+        if persistent:
             result = await self.client.call_tool(self.name, kwargs)
         else:
             async with self.client:
@@ -88,42 +152,121 @@ class MCPTool:
 
 
 class Agent:
-    def __init__(self, settings: AgentSettings):
+    def __init__(
+        self,
+        settings: AgentSettings,
+        http_client: Optional[httpx.AsyncClient] = None,
+    ):
+        # Pooled HTTP/2 connections reused across completions. Pass http_client
+        # to share one between agents; a client created here is closed by close().
+        self._owns_http_client = http_client is None
+        self._http_client = http_client or httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=40),
+            timeout=60,
+        )
         self._client = AsyncOpenAI(
-            base_url=settings.base_url, api_key=settings.openrouter_api_key
+            base_url=settings.base_url,
+            api_key=settings.openrouter_api_key,
+            http_client=self._http_client,
         )
         self._model_name = settings.model_name
         self._max_tool_call_iterations = settings.max_tool_call_iterations
         self._max_context_tokens = settings.max_context_tokens
-        self._context = []
+        self._max_parallel_messages = settings.max_parallel_messages
+        self._tool_semaphore = asyncio.Semaphore(settings.max_parallel_tool_calls)
+        self._max_parallel_tool_calls_per_server = (
+            settings.max_parallel_tool_calls_per_server
+        )
+        self._server_semaphores: dict[Client, asyncio.Semaphore] = {}
+        self._response_cache_size = settings.response_cache_size
+        self._response_cache: OrderedDict[str, dict] = OrderedDict()
+        # The system message is pinned outside _context so that trimming can
+        # evict the oldest messages from the left in O(1).
+        self._system_message: Optional[dict] = None
+        self._system_message_tokens = 0
+        self._context: deque[dict] = deque()
+        # Token count of each message in _context, kept index-aligned with it.
+        # Stored separately so the message dicts can be sent to the API as-is.
+        self._context_token_counts: deque[int] = deque()
+        # Request payload (system message + _context) reused across completions.
+        # Appends extend it in place; any other change drops it for a rebuild.
+        self._messages_cache: Optional[list[dict]] = None
         self._total_context_tokens = 0
         self._mcp_clients = []
-        self._open_clients = []
+        # Owns the keep-alive MCP client sessions; unwound LIFO by close()
+        self._exit_stack = AsyncExitStack()
+        # Short-lived clients promoted to keep-alive after repeated tool use
+        self._promoted_clients: set[Client] = set()
+        self._client_call_counts: Counter[Client] = Counter()
+        self._promote_lock = asyncio.Lock()
         self._tools = {
             GetDatetimeTool.name: GetDatetimeTool,
             GetTotalContextTokensTool.name: GetTotalContextTokensTool,
             ClearContextTool.name: ClearContextTool,
         }
+        # Rebuilt lazily from _tools; reset to None whenever _tools changes
+        self._tools_metadata_cache: Optional[list[dict]] = None
 
     def reset_context(self):
-        self._context = []
+        self._system_message = None
+        self._system_message_tokens = 0
+        self._context.clear()
+        self._context_token_counts.clear()
         self._total_context_tokens = 0
+        self._messages_cache = None
+
+    def _count_tokens(self, message: dict) -> int:
+        encoder = _get_encoder(self._model_name)
+        token_count = len(encoder.encode_ordinary(message.get("content") or ""))
+        for tool_call in message.get("tool_calls", ()):
+            function = tool_call["function"]
+            token_count += len(encoder.encode_ordinary(function["name"]))
+            token_count += len(encoder.encode_ordinary(function["arguments"]))
+        return token_count
+
+    def _append_message(self, message: dict):
+        token_count = self._count_tokens(message)
+        self._context.append(message)
+        self._context_token_counts.append(token_count)
+        self._total_context_tokens += token_count
+        if self._messages_cache is not None:
+            self._messages_cache.append(message)
+
+    def _extend_messages(self, messages: list[dict]):
+        token_counts = [self._count_tokens(message) for message in messages]
+        self._context.extend(messages)
+        self._context_token_counts.extend(token_counts)
+        self._total_context_tokens += sum(token_counts)
+        if self._messages_cache is not None:
+            self._messages_cache.extend(messages)
 
     def trim_context(self):
-        """Trim context to stay within max tokens by removing old messages."""
-        while (
-            self._total_context_tokens > self._max_context_tokens
-            and len(self._context) > 1
-        ):
-            # Remove oldest non-system message
-            if self._context[1]["role"] == "system":
-                break  # Don't remove system message
-            removed = self._context.pop(1)
-            # Note: For accurate token counting, use a tokenizer like tiktoken
-            # Here we approximate by assuming removal reduces tokens
-            self._total_context_tokens -= (
-                len(removed.get("content", "")) // 4
-            )  # Rough estimate
+        """Trim context to stay within max tokens by removing old messages.
+
+        An assistant message is removed together with its tool results, so the
+        context never starts with a tool message the API would reject.
+        """
+        # Tool results whose assistant message is already gone are invalid
+        while self._context and self._context[0]["role"] == "tool":
+            self._pop_oldest_message()
+
+        while self._total_context_tokens > self._max_context_tokens:
+            turn_length = 1
+            while (
+                turn_length < len(self._context)
+                and self._context[turn_length]["role"] == "tool"
+            ):
+                turn_length += 1
+            if turn_length >= len(self._context):
+                break  # Keep the latest turn
+            for _ in range(turn_length):
+                self._pop_oldest_message()
+
+    def _pop_oldest_message(self):
+        self._context.popleft()
+        self._total_context_tokens -= self._context_token_counts.popleft()
+        self._messages_cache = None
 
     async def __aenter__(self):
         return self
@@ -132,162 +275,354 @@ class Agent:
         await self.close()
 
     async def close(self):
-        for client in self._open_clients:
-            await client.__aexit__(None, None, None)
-        self._open_clients = []
+        await self._exit_stack.aclose()
+        self._promoted_clients.clear()
+        self._client_call_counts.clear()
+        if self._owns_http_client:
+            await self._http_client.aclose()
+
+    async def _keep_mcp_client_alive(self, client: Client):
+        async with self._promote_lock:
+            if client not in self._promoted_clients:
+                await self._exit_stack.enter_async_context(client)
+                self._promoted_clients.add(client)
+
+    async def _connect_mcp_client(self, client: Client, keep_alive: bool) -> list:
+        if not keep_alive:
+            async with client:
+                return await client.list_tools()
+        async with AsyncExitStack() as stack:
+            await stack.enter_async_context(client)
+            tools = await client.list_tools()
+            # Hand the session to the agent only once its tools are known, so a
+            # failed listing closes it right away
+            self._exit_stack.push_async_exit(stack.pop_all())
+        return tools
+
+    def _register_mcp_tools(self, client: Client, tools: list, keep_alive: bool):
+        self._mcp_clients.append(client)
+        for tool in tools:
+            mcp_tool = MCPTool(client, tool, keep_alive)
+            self._tools[mcp_tool.name] = mcp_tool
+        self._tools_metadata_cache = None
 
-    async def add_mcp_stdio_server(
-        self,
+    @staticmethod
+    def _create_stdio_client(
         command: str,
         args: Optional[list[str]] = None,
         env: Optional[dict] = None,
         keep_alive: bool = True,
-    ):
-        """Add an MCP server via STDIO transport."""
+    ) -> Client:
         transport = StdioTransport(
             command=command,
             args=args or [],
             env=env or {},
             keep_alive=keep_alive,
         )
-        client = Client(transport)
-        self._mcp_clients.append(client)
-
-        if keep_alive:
-            await client.__aenter__()
-            self._open_clients.append(client)
+        return Client(transport)
 
-        async def _load_tools():
-            if keep_alive:
-                tools = await client.list_tools()
-            else:
-                async with client:
-                    tools = await client.list_tools()
-            for tool in tools:
-                mcp_tool = MCPTool(client, tool, keep_alive)
-                self._tools[mcp_tool.name] = mcp_tool
+    @staticmethod
+    def _create_http_client(url: str, headers: Optional[dict] = None) -> Client:
+        transport = StreamableHttpTransport(url=url, headers=headers or {})
+        return Client(transport)
 
-        await _load_tools()
+    async def add_mcp_stdio_server(
+        self,
+        command: str,
+        args: Optional[list[str]] = None,
+        env: Optional[dict] = None,
+        keep_alive: bool = True,
+    ):
+        """Add an MCP server via STDIO transport."""
+        client = self._create_stdio_client(command, args, env, keep_alive)
+        tools = await self._connect_mcp_client(client, keep_alive)
+        self._register_mcp_tools(client, tools, keep_alive)
 
     async def add_mcp_http_server(
         self, url: str, headers: Optional[dict] = None, keep_alive: bool = True
     ):
         """Add an MCP server via HTTP transport."""
-        transport = StreamableHttpTransport(url=url, headers=headers or {})
-        client = Client(transport)
-        self._mcp_clients.append(client)
-
-        if keep_alive:
-            await client.__aenter__()
-            self._open_clients.append(client)
-
-        async def _load_tools():
-            if keep_alive:
-                tools = await client.list_tools()
+        client = self._create_http_client(url, headers)
+        tools = await self._connect_mcp_client(client, keep_alive)
+        self._register_mcp_tools(client, tools, keep_alive)
+
+    async def add_mcp_servers(self, specs: list[dict]):
+        """Add several MCP servers, connecting to all of them concurrently.
+
+        Each spec has a ``transport`` key (``"stdio"`` or ``"http"``) and the
+        keyword arguments of the matching ``add_mcp_*_server`` method. If some
+        servers fail to connect, the others are still registered and the
+        failures are raised afterwards as an ExceptionGroup.
+        """
+        clients = []
+        for spec in specs:
+            kwargs = dict(spec)
+            transport = kwargs.pop("transport")
+            keep_alive = kwargs.pop("keep_alive", True)
+            if transport == "stdio":
+                client = self._create_stdio_client(keep_alive=keep_alive, **kwargs)
+            elif transport == "http":
+                client = self._create_http_client(**kwargs)
             else:
-                async with client:
-                    tools = await client.list_tools()
-            for tool in tools:
-                mcp_tool = MCPTool(client, tool, keep_alive)
-                self._tools[mcp_tool.name] = mcp_tool
+                raise ValueError(f"Unknown MCP transport: {transport}")
+            clients.append((client, keep_alive))
 
-        await _load_tools()
+        # Let every connect finish so none is left running after a failure
+        results = await asyncio.gather(
+            *(self._connect_mcp_client(client, keep) for client, keep in clients),
+            return_exceptions=True,
+        )
+        errors = []
+        for (client, keep_alive), result in zip(clients, results):
+            if isinstance(result, BaseException):
+                errors.append(result)
+            else:
+                self._register_mcp_tools(client, result, keep_alive)
+        if errors:
+            raise ExceptionGroup("Failed to add MCP servers", errors)
 
     def set_system_message(self, message: str):
-        if self._context and self._context[0]["role"] == "system":
-            self._context[0]["content"] = message
-        else:
-            self._context = [{"role": "system", "content": message}] + self._context
-
-    async def _create_chat_completion(self):
-        response = await self._client.chat.completions.create(
+        self._system_message = {"role": "system", "content": message}
+        self._total_context_tokens -= self._system_message_tokens
+        self._system_message_tokens = self._count_tokens(self._system_message)
+        self._total_context_tokens += self._system_message_tokens
+        self._messages_cache = None
+
+    def _build_messages(self) -> list[dict]:
+        if self._messages_cache is None:
+            if self._system_message is None:
+                self._messages_cache = list(self._context)
+            else:
+                self._messages_cache = [self._system_message, *self._context]
+        return self._messages_cache
+
+    def _tools_metadata(self) -> list[dict]:
+        if self._tools_metadata_cache is None:
+            self._tools_metadata_cache = [
+                tool.metadata for tool in self._tools.values()
+            ]
+        return self._tools_metadata_cache
+
+    async def _create_chat_completion(self) -> tuple[dict, dict[int, asyncio.Task]]:
+        """Stream a completion and return the assistant message and started tools.
+
+        MCP tool calls are started as soon as their arguments are complete, so
+        they run while the rest of the response is still streaming. The started
+        tasks are keyed by position in the message's ``tool_calls``. Built-in
+        tools act on the agent's context and are left for the caller to start
+        once the assistant message is recorded.
+        """
+        messages = self._build_messages()
+        tools = self._tools_metadata()
+
+        cache_key = None
+        if self._response_cache_size:
+            # stdlib json: MCP schemas may hold integers wider than orjson accepts
+            payload = {"m": self._model_name, "msgs": messages, "tools": tools}
+            cache_key = hashlib.blake2b(
+                json.dumps(payload, sort_keys=True).encode()
+            ).hexdigest()
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                self._response_cache.move_to_end(cache_key)
+                logger.debug("Chat completion served from response cache")
+                return cached, {}
+
+        stream = await self._client.chat.completions.create(
             model=self._model_name,
-            messages=self._context,  # type: ignore
-            tools=[tool.metadata for tool in self._tools.values()],  # type: ignore
+            messages=messages,  # type: ignore
+            tools=tools,  # type: ignore
             tool_choice="auto",  # Let the model decide when to use a tool
+            stream=True,
+        )
+
+        content_parts = []
+        tool_calls: dict[int, dict] = {}
+        tool_tasks: dict[int, asyncio.Task] = {}
+        # Bound once; these are hit for every streamed chunk
+        append_content = content_parts.append
+        start_tool_call = self._start_tool_call
+        tools_by_name = self._tools
+        try:
+            # Closing the stream releases its connection even on error or cancel
+            async with stream:
+                async for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        append_content(delta.content)
+                    for tool_call_delta in delta.tool_calls or []:
+                        index = tool_call_delta.index
+                        tool_call = tool_calls.get(index)
+                        if tool_call is None:
+                            tool_call = tool_calls[index] = {
+                                "id": "",
+                                "type": "function",
+                                "function": {"name": "", "arguments": ""},
+                            }
+                        if tool_call_delta.id:
+                            tool_call["id"] = tool_call_delta.id
+                        function_delta = tool_call_delta.function
+                        if function_delta is None:
+                            continue
+                        function = tool_call["function"]
+                        if function_delta.name:
+                            function["name"] += function_delta.name
+                        arguments_delta = function_delta.arguments
+                        if arguments_delta:
+                            function["arguments"] += arguments_delta
+                            # Only a closing brace can complete the arguments object
+                            if "}" in arguments_delta and index not in tool_tasks:
+                                # Built-ins touch the context, so they wait until
+                                # the assistant turn has been recorded
+                                tool = tools_by_name.get(function["name"])
+                                if not isinstance(tool, MCPTool):
+                                    continue
+                                try:
+                                    orjson.loads(function["arguments"])
+                                except orjson.JSONDecodeError:
+                                    continue
+                                tool_tasks[index] = start_tool_call(tool_call)
+        except BaseException:
+            for task in tool_tasks.values():
+                task.cancel()
+            raise
+
+        assistant_dict = {"role": "assistant", "content": "".join(content_parts)}
+        if tool_calls:
+            assistant_dict["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+        # Lazy so the message is only serialized when a debug sink is active
+        logger.opt(lazy=True).debug(
+            "Chat completion message:\n{}",
+            lambda: orjson.dumps(assistant_dict, option=orjson.OPT_INDENT_2).decode(),
         )
-        logger.debug("Chat completion response:\n" + response.model_dump_json(indent=2))
-        return response
+        if cache_key is not None:
+            self._response_cache[cache_key] = assistant_dict
+            if len(self._response_cache) > self._response_cache_size:
+                self._response_cache.popitem(last=False)
+        return assistant_dict, {
+            position: tool_tasks[index]
+            for position, index in enumerate(sorted(tool_calls))
+            if index in tool_tasks
+        }
 
     async def send_message(self, message: str) -> str:
-        self._context.append({"role": "user", "content": message})
+        command_tool = LOCAL_COMMANDS.get(message.strip())
+        if command_tool is not None:
+            reply = await command_tool.call(self)
+            self._extend_messages(
+                [
+                    {"role": "user", "content": message},
+                    {"role": "assistant", "content": reply},
+                ]
+            )
+            return reply
+
+        self._append_message({"role": "user", "content": message})
 
         iteration = 0
-        assistant_message = None
+        reply = ""
+        tool_messages = []
         while iteration < self._max_tool_call_iterations:
-            response = await self._create_chat_completion()
-            self._total_context_tokens = response.usage.total_tokens
+            # Token counts are local, so trim before an over-budget request
             self.trim_context()
+            if self._system_message is None and not self._context:
+                # A tool cleared the context; an empty request would be rejected,
+                # so answer with the last tool result instead
+                if tool_messages:
+                    reply = tool_messages[-1]["content"]
+                break
+            assistant_dict, started_tasks = await self._create_chat_completion()
+            self._append_message(assistant_dict)
+            reply = assistant_dict["content"]
 
-            assistant_message = response.choices[0].message
-
-            assistant_dict = {
-                "role": "assistant",
-                "content": assistant_message.content or "",
-            }
-            if assistant_message.tool_calls:
-                assistant_dict["tool_calls"] = assistant_message.tool_calls  # type: ignore
-            self._context.append(assistant_dict)
-
-            if not assistant_message.tool_calls:
+            tool_calls = assistant_dict.get("tool_calls")
+            if not tool_calls:
                 break
 
-            # Parallel tool calls if independent
-            tool_tasks = []
-            for tool_call in assistant_message.tool_calls:
-                function_name = tool_call.function.name
-                try:
-                    function_args = json.loads(tool_call.function.arguments)
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse tool arguments: {e}")
-                    tool_response = f"Error parsing arguments: {str(e)}"
-                    self._context.append(
-                        {
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "name": function_name,
-                            "content": tool_response,
-                        }
-                    )
-                    continue
-
-                if function_name in self._tools:
-                    tool = self._tools[function_name]
-                    # Create task for parallel execution
-                    task = self._call_tool_safe(
-                        tool, function_args, tool_call.id, function_name
-                    )
-                    tool_tasks.append(task)
-                else:
-                    logger.warning(f"Unknown tool: {function_name}")
-                    self._context.append(
-                        {
-                            "role": "tool",
-                            "tool_call_id": tool_call.id,
-                            "name": function_name,
-                            "content": f"Unknown tool: {function_name}",
-                        }
-                    )
-
-            # Execute all tool calls in parallel
-            if tool_tasks:
-                await asyncio.gather(*tool_tasks)
+            # Start the calls not already running, now that the assistant turn is
+            # recorded, and collect all results in tool_calls order
+            tool_tasks = [
+                started_tasks.get(position) or self._start_tool_call(tool_call)
+                for position, tool_call in enumerate(tool_calls)
+            ]
+            tool_messages = await asyncio.gather(*tool_tasks)
+            self._extend_messages(tool_messages)
 
             iteration += 1
 
-        return assistant_message.content or "" if assistant_message else ""
+        return reply
+
+    async def send_messages(self, messages: list[str]) -> list[str]:
+        """Answer independent messages concurrently, each on a copy of the context.
+
+        The agent's own context is left unchanged. If any message fails, the
+        rest are cancelled and the failures are raised as an ExceptionGroup.
+        """
+        semaphore = asyncio.Semaphore(self._max_parallel_messages)
+
+        async def _send(message: str) -> str:
+            async with semaphore:
+                return await self._fork().send_message(message)
+
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(_send(message)) for message in messages]
+        return [task.result() for task in tasks]
+
+    def _fork(self) -> "Agent":
+        # Shares the API client, tools, MCP sessions and limits; message dicts
+        # are never mutated in place, so copying the containers is enough.
+        fork = copy.copy(self)
+        fork._context = self._context.copy()
+        fork._context_token_counts = self._context_token_counts.copy()
+        fork._messages_cache = None
+        return fork
+
+    def _server_semaphore(self, tool):
+        client = getattr(tool, "client", None)
+        if client is None:
+            return nullcontext()  # Built-in tools run locally
+        semaphore = self._server_semaphores.get(client)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self._max_parallel_tool_calls_per_server)
+            self._server_semaphores[client] = semaphore
+        return semaphore
+
+    def _start_tool_call(self, tool_call: dict) -> asyncio.Task:
+        return asyncio.create_task(self._run_tool_call(tool_call))
+
+    async def _run_tool_call(self, tool_call: dict) -> dict:
+        tool_call_id = tool_call["id"]
+        function_name = tool_call["function"]["name"]
+        tool = self._tools.get(function_name)
+        if tool is None:
+            logger.warning(f"Unknown tool: {function_name}")
+            return _tool_message(
+                tool_call_id, function_name, f"Unknown tool: {function_name}"
+            )
+
+        try:
+            # Zero-argument tools may come back with empty arguments
+            function_args = orjson.loads(tool_call["function"]["arguments"] or "{}")
+        except orjson.JSONDecodeError as e:
+            logger.error(f"Failed to parse tool arguments: {e}")
+            return _tool_message(
+                tool_call_id, function_name, f"Error parsing arguments: {str(e)}"
+            )
+
+        return await self._call_tool_safe(
+            tool, function_args, tool_call_id, function_name
+        )
 
-    async def _call_tool_safe(self, tool, function_args, tool_call_id, function_name):
+    async def _call_tool_safe(
+        self, tool, function_args, tool_call_id, function_name
+    ) -> dict:
         try:
-            tool_response = await tool.call(self, **function_args)
+            # Take the server slot first so a busy server doesn't hold global slots
+            async with self._server_semaphore(tool), self._tool_semaphore:
+                tool_response = await tool.call(self, **function_args)
         except Exception as e:
             logger.error(f"Tool {function_name} failed: {e}")
             tool_response = f"Error: {str(e)}"
-        self._context.append(
-            {
-                "role": "tool",
-                "tool_call_id": tool_call_id,
-                "name": function_name,
-                "content": str(tool_response),
-            }
-        )
+        return _tool_message(tool_call_id, function_name, str(tool_response))